@@ -1,63 +1,133 @@
 import datetime
+import email.utils
+import time
 import uuid
-from typing import Any, Optional
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 
 import feedparser  # type: ignore[import-untyped]
-import PyRSS2Gen  # type: ignore[import-untyped]
 from flask import url_for
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 from app import config, db, logger
 from app.models import Feed, Post
 from shared.podcast_downloader import find_audio_link
 
+FAILED_FETCH_RETRY_SECONDS = 15 * 60
+
+GUID_PLACEHOLDER = "__GUID__"
+
+# url -> time.monotonic() of the last failed fetch, so a broken upstream
+# server is not hit again on every request
+failed_fetches: Dict[str, float] = {}
+
+
+def fetch_feed(
+    url: str,
+    etag: Optional[str] = None,
+    modified: Optional[str] = None,
+    skip_recently_failed: bool = True,
+) -> Optional[feedparser.FeedParserDict]:
+    """
+    Fetch and parse a feed. Returns None when the server reports the feed is
+    unchanged since etag/modified, when fetching it fails, or, unless
+    skip_recently_failed is False, when fetching it failed recently.
+    """
+    failed_at = failed_fetches.get(url)
+    if (
+        skip_recently_failed
+        and failed_at is not None
+        and time.monotonic() - failed_at < FAILED_FETCH_RETRY_SECONDS
+    ):
+        logger.info(f"Skipping fetch of recently failed feed URL: {url}")
+        return None
 
-def fetch_feed(url: str) -> feedparser.FeedParserDict:
     logger.info(f"Fetching feed from URL: {url}")
-    feed_data = feedparser.parse(url)
+    feed_data = feedparser.parse(url, etag=etag, modified=modified)
+
+    status = feed_data.get("status")
+    if status == 304:
+        logger.info(f"Feed not modified since last fetch: {url}")
+        return None
+    if (status is not None and status >= 400) or (
+        feed_data.bozo and not feed_data.entries
+    ):
+        logger.error(
+            f"Failed to fetch feed from URL: {url} (status: {status}): "
+            + f"{feed_data.get('bozo_exception')}"
+        )
+        failed_fetches[url] = time.monotonic()
+        return None
+    failed_fetches.pop(url, None)
+
     for entry in feed_data.entries:
         entry.id = get_guid(entry)
     return feed_data
 
 
-def refresh_feed(feed: Feed) -> None:
+def fetch_feeds_bulk(
+    feeds: List[Feed],
+) -> Dict[str, Optional[feedparser.FeedParserDict]]:
+    """
+    Fetch several feeds concurrently. Fetching is network bound, so threads
+    overlap the round trips instead of waiting on each feed in turn.
+    """
+    if not feeds:
+        return {}
+    urls = [feed.rss_url for feed in feeds]
+    etags = [feed.etag for feed in feeds]
+    modifieds = [feed.modified for feed in feeds]
+    max_workers = min(config.feed_fetch_workers, len(feeds))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(urls, executor.map(fetch_feed, urls, etags, modifieds)))
+
+
+def refresh_feed(
+    feed: Feed, feed_data: Optional[feedparser.FeedParserDict] = None
+) -> None:
     logger.info(f"Refreshing feed with ID: {feed.id}")
-    feed_data = fetch_feed(feed.rss_url)
-    existing_posts = {post.guid for post in feed.posts}  # type: ignore[attr-defined]
-    oldest_post = min(
-        (post for post in feed.posts if post.release_date),  # type: ignore[attr-defined]
-        key=lambda p: p.release_date,
-        default=None,
+    if feed_data is None:
+        feed_data = fetch_feed(feed.rss_url, etag=feed.etag, modified=feed.modified)
+        if feed_data is None:
+            logger.info(
+                f"Feed with ID: {feed.id} unchanged or unavailable, skipping refresh"
+            )
+            return
+    feed.etag = feed_data.get("etag")
+    feed.modified = feed_data.get("modified")
+    oldest_release_date = (
+        db.session.query(db.func.min(Post.release_date))
+        .filter(Post.feed_id == feed.id)
+        .scalar()
     )
-    for entry in feed_data.entries:
-        if entry.id not in existing_posts:
-            logger.debug(f"found new podcast: {entry.title}")
-            p = make_post(feed, entry)
-            # do not allow automatic download of any backcatalog added to the feed
-            if (
-                oldest_post is not None
-                and p.release_date.date() < oldest_post.release_date
-            ):
-                p.whitelisted = False
-                logger.debug(
-                    f"skipping post from archive due to \
-number_of_episodes_to_whitelist_from_archive_of_new_feed setting: {entry.title}"
-                )
-            else:
-                p.whitelisted = config.automatically_whitelist_new_episodes
-            db.session.add(p)
+    rows = extract_post_rows(feed.id, feed_data.entries)
+    for row in rows:
+        # do not allow automatic download of any backcatalog added to the feed
+        if (
+            oldest_release_date is not None
+            and row["release_date"] is not None
+            and row["release_date"].date() < oldest_release_date
+        ):
+            row["whitelisted"] = False
+        else:
+            row["whitelisted"] = config.automatically_whitelist_new_episodes
+    # posts already stored are skipped by the insert itself
+    insert_posts(rows)
     db.session.commit()
     logger.info(f"Feed with ID: {feed.id} refreshed")
 
 
 def add_or_refresh_feed(url: str) -> Feed:
-    feed_data = fetch_feed(url)
-    if "title" not in feed_data.feed:
+    # a user adding a feed by hand should always get a fresh attempt
+    feed_data = fetch_feed(url, skip_recently_failed=False)
+    if feed_data is None or "title" not in feed_data.feed:
         logger.error("Invalid feed URL")
         raise ValueError(f"Invalid feed URL: {url}")
 
     feed = Feed.query.filter_by(rss_url=url).first()
     if feed:
-        refresh_feed(feed)
+        refresh_feed(feed, feed_data)
     else:
         feed = add_feed(feed_data)
     return feed  # type: ignore[no-any-return]
@@ -71,13 +141,15 @@ def add_feed(feed_data: feedparser.FeedParserDict) -> Feed:
             description=feed_data.feed.get("description", ""),
             author=feed_data.feed.get("author", ""),
             rss_url=feed_data.href,
+            etag=feed_data.get("etag"),
+            modified=feed_data.get("modified"),
         )
         db.session.add(feed)
         db.session.commit()
 
         num_posts_added = 0
-        for entry in feed_data.entries:
-            p = make_post(feed, entry)
+        rows = extract_post_rows(feed.id, feed_data.entries)
+        for row in rows:
             if (
                 config.number_of_episodes_to_whitelist_from_archive_of_new_feed
                 is not None
@@ -87,11 +159,11 @@ def add_feed(feed_data: feedparser.FeedParserDict) -> Feed:
                 logger.info(
                     f"Number of episodes to load from archive reached: {num_posts_added}"
                 )
-                p.whitelisted = False
+                row["whitelisted"] = False
             else:
                 num_posts_added += 1
-                p.whitelisted = config.automatically_whitelist_new_episodes
-            db.session.add(p)
+                row["whitelisted"] = config.automatically_whitelist_new_episodes
+        insert_posts(rows)
         db.session.commit()
         logger.info(f"Feed stored with ID: {feed.id}")
         return feed
@@ -101,28 +173,46 @@ def add_feed(feed_data: feedparser.FeedParserDict) -> Feed:
         raise e
 
 
-def feed_item(post: Post) -> PyRSS2Gen.RSSItem:
+def get_audio_url_template() -> str:
     """
-    Given a post, return the corresponding RSS item. Reference:
-    https://github.com/Podcast-Standards-Project/PSP-1-Podcast-RSS-Specification?tab=readme-ov-file#required-item-elements
+    Build the download url once per feed with a placeholder guid, so each item
+    only needs a string replace instead of a full url_for.
     """
-
-    audio_url = (config.server if config.server is not None else "") + url_for(
+    return (config.server if config.server is not None else "") + url_for(
         "main.download_post",
-        p_guid=post.guid,
+        p_guid=GUID_PLACEHOLDER,
         _external=config.server is None,
     )
 
-    item = PyRSS2Gen.RSSItem(
-        title=post.title,
-        enclosure=PyRSS2Gen.Enclosure(
-            url=audio_url,
-            type="audio/mpeg",
-            length=post.audio_len_bytes(),
-        ),
-        description=post.description,
-        guid=post.guid,
-        pubDate=(
+
+def add_text_element(parent: ET.Element, tag: str, text: Optional[str]) -> None:
+    if text is not None:
+        ET.SubElement(parent, tag).text = text
+
+
+def feed_item(post: Post, audio_url_template: str) -> ET.Element:
+    """
+    Given a post, return the corresponding RSS item. Reference:
+    https://github.com/Podcast-Standards-Project/PSP-1-Podcast-RSS-Specification?tab=readme-ov-file#required-item-elements
+    """
+
+    audio_url = audio_url_template.replace(GUID_PLACEHOLDER, post.guid)
+
+    item = ET.Element("item")
+    add_text_element(item, "title", post.title)
+    add_text_element(item, "description", post.description)
+    ET.SubElement(
+        item,
+        "enclosure",
+        url=audio_url,
+        length=str(post.audio_len_bytes()),
+        type="audio/mpeg",
+    )
+    add_text_element(item, "guid", post.guid)
+    add_text_element(
+        item,
+        "pubDate",
+        (
             post.release_date.strftime("%a, %d %b %Y %H:%M:%S %z")
             if post.release_date
             else None
@@ -132,35 +222,72 @@ def feed_item(post: Post) -> PyRSS2Gen.RSSItem:
     return item
 
 
-def generate_feed_xml(feed: Feed) -> Any:
+def generate_feed_xml(feed: Feed) -> bytes:
     logger.info(f"Generating XML for feed with ID: {feed.id}")
-    items = [feed_item(post) for post in feed.posts]  # type: ignore[attr-defined]
-    rss_feed = PyRSS2Gen.RSS2(
-        title="[podly] " + feed.title,
-        link=url_for("main.get_feed", f_id=feed.id, _external=True),
-        description=feed.description,
-        lastBuildDate=datetime.datetime.now(),
-        items=items,
+    rss = ET.Element("rss", version="2.0")
+    channel = ET.SubElement(rss, "channel")
+    add_text_element(channel, "title", "[podly] " + feed.title)
+    add_text_element(
+        channel, "link", url_for("main.get_feed", f_id=feed.id, _external=True)
     )
-    logger.info(f"XML generated for feed with ID: {feed.id}")
-    return rss_feed.to_xml("utf-8")
-
-
-def make_post(feed: Feed, entry: feedparser.FeedParserDict) -> Post:
-    return Post(
-        feed_id=feed.id,
-        guid=get_guid(entry),
-        download_url=find_audio_link(entry),
-        title=entry.title,
-        description=entry.get("description", ""),
-        release_date=(
-            datetime.datetime(*entry.published_parsed[:6])
-            if entry.get("published_parsed")
-            else None
+    add_text_element(channel, "description", feed.description)
+    add_text_element(
+        channel,
+        "lastBuildDate",
+        email.utils.format_datetime(
+            datetime.datetime.now(datetime.timezone.utc), usegmt=True
         ),
-        duration=get_duration(entry),
     )
 
+    # only the most recent episodes, so long running feeds stay small
+    posts = (
+        Post.query.filter_by(feed_id=feed.id)
+        .order_by(Post.release_date.desc())
+        .limit(config.feed_item_limit)
+        .all()
+    )
+    audio_url_template = get_audio_url_template()
+    channel.extend(feed_item(post, audio_url_template) for post in posts)
+
+    feed_xml: bytes = ET.tostring(rss, encoding="utf-8", xml_declaration=True)
+    logger.info(f"XML generated for feed with ID: {feed.id}")
+    return feed_xml
+
+
+def insert_posts(rows: List[Dict[str, Any]]) -> None:
+    """
+    Insert post rows in a single statement. Rows that clash with an existing
+    post (same guid or download url) are skipped instead of failing the insert.
+    """
+    if not rows:
+        return
+    db.session.execute(sqlite_insert(Post).on_conflict_do_nothing(), rows)
+
+
+def extract_post_rows(
+    feed_id: int, entries: List[feedparser.FeedParserDict]
+) -> List[Dict[str, Any]]:
+    """
+    Extract the post columns of every entry in one pass, ready for
+    insert_posts. Entry ids have already been replaced by guids in fetch_feed.
+    """
+    return [
+        {
+            "feed_id": feed_id,
+            "guid": entry.id,
+            "download_url": find_audio_link(entry),
+            "title": entry.title,
+            "description": entry.get("description", ""),
+            "release_date": (
+                datetime.datetime(*published[:6])
+                if (published := entry.get("published_parsed"))
+                else None
+            ),
+            "duration": get_duration(entry),
+        }
+        for entry in entries
+    ]
+
 
 # sometimes feed entry ids are the post url or something else
 def get_guid(entry: feedparser.FeedParserDict) -> str:
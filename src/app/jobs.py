@@ -1,12 +1,74 @@
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Dict, List
+
+from flask import Flask
 
 from app import config, db, logger, scheduler
-from app.feeds import refresh_feed
+from app.feeds import fetch_feeds_bulk, refresh_feed
 from app.models import Feed, Post
 from app.posts import download_and_process_post, remove_associated_files
 
+# episodes requested over http are processed here rather than in the request
+# thread, so slow processing does not tie up the web server's workers
+post_processing_executor = ThreadPoolExecutor(
+    max_workers=config.threads, thread_name_prefix="post-processing"
+)
+# queued or running jobs only, finished ones move to finished_post_processing
+post_processing_jobs: Dict[str, Future[str]] = {}
+# status of the most recently finished jobs, oldest first
+finished_post_processing: OrderedDict[str, Dict[str, str]] = OrderedDict()
+post_processing_jobs_lock = threading.Lock()
+
+FINISHED_POST_PROCESSING_LIMIT = 1000
+
+
+def enqueue_post_processing(app: Flask, p_guid: str) -> None:
+    """Queue download and processing of a post unless it is already queued."""
+    with post_processing_jobs_lock:
+        if p_guid in post_processing_jobs:
+            return
+        logger.info(f"Queueing processing of post with GUID: {p_guid}")
+        job = post_processing_executor.submit(run_post_processing, app, p_guid)
+        post_processing_jobs[p_guid] = job
+    # outside the lock: the callback runs right away if the job already finished
+    job.add_done_callback(lambda done: finish_post_processing(p_guid, done))
+
+
+def run_post_processing(app: Flask, p_guid: str) -> str:
+    with app.app_context():
+        try:
+            return download_and_process_post(p_guid)
+        except Exception as e:
+            logger.error(f"Error processing post with GUID {p_guid}: {e}")
+            raise
+
+
+def finish_post_processing(p_guid: str, job: Future[str]) -> None:
+    """Record the outcome of a job and drop the job, and with it any traceback."""
+    error = job.exception()
+    status = (
+        {"status": "done"}
+        if error is None
+        else {"status": "failed", "error": str(error)}
+    )
+    with post_processing_jobs_lock:
+        if post_processing_jobs.get(p_guid) is job:
+            del post_processing_jobs[p_guid]
+        finished_post_processing[p_guid] = status
+        finished_post_processing.move_to_end(p_guid)
+        while len(finished_post_processing) > FINISHED_POST_PROCESSING_LIMIT:
+            finished_post_processing.popitem(last=False)
+
+
+def get_post_processing_status(p_guid: str) -> Dict[str, str]:
+    with post_processing_jobs_lock:
+        if p_guid in post_processing_jobs:
+            return {"status": "processing"}
+        return finished_post_processing.get(p_guid, {"status": "not_started"})
+
 
 def run_refresh_all_feeds() -> None:
     """Main entry point for refreshing all feeds."""
@@ -39,9 +101,16 @@ def refresh_all_feeds() -> None:
         # Refresh each feed
         feeds = Feed.query.all()
         logger.info(f"Found {len(feeds)} feeds to refresh.")
+        feed_data_by_url = fetch_feeds_bulk(feeds)
         for feed in feeds:
+            feed_data = feed_data_by_url[feed.rss_url]
+            if feed_data is None:
+                logger.info(
+                    f"Feed unchanged or unavailable: {feed.title} (ID: {feed.id})"
+                )
+                continue
             logger.info(f"Refreshing feed: {feed.title} (ID: {feed.id})")
-            refresh_feed(feed)
+            refresh_feed(feed, feed_data)
         logger.info("All feeds refreshed and database updated.")
 
         # Identify and Handle Inconsistent Posts
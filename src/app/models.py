@@ -18,6 +18,9 @@ class Feed(db.Model):  # type: ignore[name-defined, misc]
     description = db.Column(db.Text)
     author = db.Column(db.Text)
     rss_url = db.Column(db.Text, unique=True, nullable=False)
+    # validators from the last fetch, sent back for conditional GETs
+    etag = db.Column(db.Text, nullable=True)
+    modified = db.Column(db.Text, nullable=True)
 
     posts = db.relationship(
         "Post", backref="feed", lazy=True, order_by="Post.release_date.desc()"
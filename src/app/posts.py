@@ -1,3 +1,4 @@
+import threading
 from pathlib import Path
 from typing import Optional
 
@@ -9,6 +10,21 @@ from podcast_processor.podcast_processor import (
 )
 from shared.podcast_downloader import download_episode, get_and_make_download_path
 
+_processor: Optional[PodcastProcessor] = None  # pylint: disable=invalid-name
+_processor_lock = threading.Lock()
+
+
+def get_processor() -> PodcastProcessor:
+    """
+    Return the processor shared by all requests and jobs, creating it on first
+    use. Per-episode state lives in process(), so one instance is thread safe.
+    """
+    global _processor  # pylint: disable=global-statement
+    with _processor_lock:
+        if _processor is None:
+            _processor = PodcastProcessor(config)
+        return _processor
+
 
 def remove_associated_files(post: Post) -> None:
     """
@@ -91,8 +107,7 @@ def download_and_process_post(p_guid: str, blocking: bool = True) -> str:
     db.session.commit()
 
     # Process the episode
-    processor = PodcastProcessor(config)
-    output_path = processor.process(post, blocking)
+    output_path = get_processor().process(post, blocking)
     if output_path is None:
         raise PostException("Processing failed")
     return output_path
@@ -1,3 +1,4 @@
+import os
 import re
 from pathlib import Path
 
@@ -8,14 +9,18 @@ from flask.typing import ResponseReturnValue
 
 from app import config, db, logger
 from app.feeds import add_or_refresh_feed, generate_feed_xml, refresh_feed
+from app.jobs import enqueue_post_processing, get_post_processing_status
 from app.models import Feed, Post
-from app.posts import download_and_process_post
 
 main_bp = Blueprint("main", __name__)
 
+MISSING_SCHEME_SLASH_PATTERN = re.compile(r"(http(s)?):/([^/])")
+
+PROCESSING_RETRY_AFTER_SECONDS = 60
+
 
 def fix_url(url: str) -> str:
-    url = re.sub(r"(http(s)?):/([^/])", r"\1://\3", url)
+    url = MISSING_SCHEME_SLASH_PATTERN.sub(r"\1://\3", url)
     if not url.startswith("http://") and not url.startswith("https://"):
         url = "https://" + url
     return url
@@ -73,15 +78,66 @@ def download_post(p_guid: str) -> flask.Response:
         logger.warning(f"Post: {post.title} is not whitelisted")
         return flask.make_response(("Episode not whitelisted", 403))
 
-    output_path = download_and_process_post(p_guid)
+    if post.processed_audio_path is None or not os.path.exists(
+        post.processed_audio_path
+    ):
+        # processing takes minutes, so hand it to a worker instead of holding
+        # this request open
+        app = flask.current_app._get_current_object()  # type: ignore[attr-defined]  # pylint: disable=protected-access
+        enqueue_post_processing(app, p_guid)
+        status_url = url_for("main.post_status", p_guid=p_guid)
+        preferred_type = request.accept_mimetypes.best_match(
+            ["audio/mpeg", "text/html"]
+        )
+        if preferred_type == "text/html":
+            # a browser following a link from the ui, show it the status
+            return flask.make_response(
+                jsonify({"status": "processing", "status_url": status_url}),
+                202,
+                {"Location": status_url},
+            )
+        # podcast clients fetch this as the episode enclosure and would save a
+        # success response as the audio, so ask them to retry later instead
+        return flask.make_response(
+            "Episode is being processed, retry later",
+            503,
+            {
+                "Retry-After": str(PROCESSING_RETRY_AFTER_SECONDS),
+                "Location": status_url,
+            },
+        )
 
     try:
-        return send_file(path_or_file=Path(output_path).resolve())
+        # conditional responses let podcast clients resume and seek with
+        # Range requests (206) and revalidate cached episodes (304)
+        response = send_file(
+            path_or_file=Path(post.processed_audio_path).resolve(),
+            mimetype="audio/mpeg",
+            conditional=True,
+            etag=True,
+            max_age=3600,
+        )
+        response.headers["Accept-Ranges"] = "bytes"
+        return response
     except Exception as e:  # pylint: disable=broad-exception-caught
         logger.error(f"Error sending file: {e}")
         return flask.make_response(("Error sending file", 500))
 
 
+@main_bp.route("/post/<string:p_guid>/status", methods=["GET"])
+def post_status(p_guid: str) -> ResponseReturnValue:
+    post = Post.query.filter_by(guid=p_guid).first()
+    if post is None:
+        return flask.make_response(("Post not found", 404))
+
+    if post.processed_audio_path is not None and os.path.exists(
+        post.processed_audio_path
+    ):
+        return flask.redirect(url_for("main.download_post", p_guid=p_guid))
+
+    return flask.make_response(jsonify(get_post_processing_status(p_guid)), 200)
+
+
 @main_bp.route("/feed", methods=["POST"])
 def add_feed() -> ResponseReturnValue:
     data = request.form
@@ -76,7 +76,9 @@ class PodcastProcessor:
             self.transcriber = TestWhisperTranscriber(self.logger)
         elif isinstance(self.config.whisper, RemoteWhisperConfig):
             self.transcriber = RemoteWhisperTranscriber(
-                self.logger, self.config.whisper
+                self.logger,
+                self.config.whisper,
+                max_concurrent=self.config.whisper.max_concurrent_requests,
             )
         elif isinstance(self.config.whisper, LocalWhisperConfig):
             self.transcriber = LocalWhisperTranscriber(
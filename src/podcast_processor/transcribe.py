@@ -1,18 +1,42 @@
+import asyncio
+import hashlib
+import json
 import logging
 import math
 import os
-import shutil
+import queue
+import random
+import re
+import subprocess
+import tempfile
+import threading
 import time
 from abc import ABC, abstractmethod
-from typing import Any, List, Tuple
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Tuple
 
 import whisper  # type: ignore[import-untyped]
-from openai import OpenAI
+from mutagen import MutagenError
+from mutagen.mp3 import MP3
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    AsyncOpenAI,
+    InternalServerError,
+    RateLimitError,
+)
 from openai.types.audio.transcription_segment import TranscriptionSegment
 from pydantic import BaseModel
-from pydub import AudioSegment  # type: ignore[import-untyped]
 
 from shared.config import RemoteWhisperConfig
+from shared.processing_paths import TRANSCRIPTION_CACHE_DIR
+
+# extracted chunks waiting for an upload slot
+CHUNK_QUEUE_SIZE = 4
+
+# model names may contain path separators, e.g. "openai/whisper-large-v3"
+CACHE_KEY_SANITIZE_PATTERN = re.compile(r"[^a-zA-Z0-9._-]")
 
 
 class Segment(BaseModel):
@@ -89,32 +113,273 @@ class LocalWhisperTranscriber(Transcriber):
         return self.local_seg_to_seg(typed_segments)
 
 
+class RateLimiter:
+    """
+    Token bucket limiting how many requests may start per minute. Thread safe,
+    so one limiter can be shared by transcriptions running on separate event
+    loops.
+    """
+
+    def __init__(self, max_requests_per_minute: int):
+        self.capacity = float(max_requests_per_minute)
+        self.tokens = self.capacity
+        self.refill_per_second = max_requests_per_minute / 60.0
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """Take a token, returning 0, or return the seconds until one is free."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self.last_refill) * self.refill_per_second,
+            )
+            self.last_refill = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.refill_per_second
+
+    async def acquire(self) -> None:
+        # sleep outside the lock so waiting never blocks another event loop
+        while (wait_time := self.try_acquire()) > 0:
+            await asyncio.sleep(wait_time)
+
+
 class RemoteWhisperTranscriber(Transcriber):
-    def __init__(self, logger: logging.Logger, config: RemoteWhisperConfig):
+    def __init__(
+        self,
+        logger: logging.Logger,
+        config: RemoteWhisperConfig,
+        max_concurrent: int = 5,
+        cache_dir: Path = TRANSCRIPTION_CACHE_DIR,
+    ):
         self.logger = logger
         self.config = config
+        self.max_concurrent = max_concurrent
+        self.cache_dir = cache_dir
+        # shared by every transcription so concurrent episodes split one budget
+        self.rate_limiter = (
+            RateLimiter(config.max_requests_per_minute)
+            if config.max_requests_per_minute is not None
+            else None
+        )
 
-        self.openai_client = OpenAI(
-            base_url=config.base_url,
-            api_key=config.api_key,
+    def make_client(self) -> AsyncOpenAI:
+        # one client per transcription: its connection pool is shared by all
+        # chunks, but is bound to the event loop asyncio.run creates
+        return AsyncOpenAI(
+            base_url=self.config.base_url,
+            api_key=self.config.api_key,
+            # retries are handled by get_segments_for_chunk_with_retry
+            max_retries=0,
         )
 
     def transcribe(self, audio_file_path: str) -> List[Segment]:
         self.logger.info("Using remote whisper")
-        audio_chunk_path = audio_file_path + "_parts"
 
-        chunks = self.split_file(audio_file_path, audio_chunk_path)
+        cache_path = self.get_cache_path(audio_file_path)
+        cached_segments = self.load_cached_segments(cache_path)
+        if cached_segments is not None:
+            self.logger.info(f"Using cached transcription {cache_path}")
+            return cached_segments
+
+        segments = asyncio.run(self._atranscribe(audio_file_path))
+        self.store_cached_segments(cache_path, segments)
+        return segments
+
+    def get_cache_path(self, audio_file_path: str) -> Path:
+        # keyed by content so a re-downloaded or re-processed episode is free,
+        # and by model and language so changing either transcribes again
+        digest = self.hash_file(audio_file_path)
+        key = f"{digest}-{self.config.model}-{self.config.language}"
+        return self.cache_dir / f"{CACHE_KEY_SANITIZE_PATTERN.sub('_', key)}.json"
 
-        all_segments: List[TranscriptionSegment] = []
+    @staticmethod
+    def hash_file(audio_file_path: str) -> str:
+        # stream the file rather than reading a whole episode into memory
+        with open(audio_file_path, "rb") as f:
+            if hasattr(hashlib, "file_digest"):  # python 3.11+
+                return hashlib.file_digest(f, "sha256").hexdigest()
+            digest = hashlib.sha256()
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+            return digest.hexdigest()
+
+    def load_cached_segments(self, cache_path: Path) -> Optional[List[Segment]]:
+        if not cache_path.exists():
+            return None
+        try:
+            with open(cache_path, "r") as f:
+                return [Segment(**segment) for segment in json.load(f)]
+        except (OSError, ValueError, TypeError) as e:
+            self.logger.warning(f"Ignoring unreadable cached transcription: {e}")
+            return None
+
+    def store_cached_segments(self, cache_path: Path, segments: List[Segment]) -> None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file first so readers never see a partial cache
+        with tempfile.NamedTemporaryFile(
+            "w", dir=cache_path.parent, suffix=".tmp", delete=False
+        ) as f:
+            json.dump([segment.model_dump() for segment in segments], f)
+        os.replace(f.name, cache_path)
+
+    async def _atranscribe(self, audio_file_path: str) -> List[Segment]:
+        # chunks are independent network-bound requests, so send them
+        # concurrently while bounding the number in flight
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        async def transcribe_chunk(
+            client: AsyncOpenAI, offset: int, chunk: BytesIO
+        ) -> List[TranscriptionSegment]:
+            try:
+                segments = await self.get_segments_for_chunk_with_retry(
+                    client, offset, chunk, self.rate_limiter
+                )
+            finally:
+                semaphore.release()
+            return self.add_offset_to_segments(segments, offset)
+
+        # extract chunks on a worker thread so ffmpeg work on the next chunks
+        # overlaps with uploads of the previous ones
+        chunk_queue: "queue.Queue[Optional[Tuple[int, BytesIO]]]" = queue.Queue(
+            maxsize=CHUNK_QUEUE_SIZE
+        )
+        stop_producing = threading.Event()
+        loop = asyncio.get_running_loop()
+        producer = loop.run_in_executor(
+            None, self.produce_chunks, audio_file_path, chunk_queue, stop_producing
+        )
 
-        for chunk in chunks:
-            chunk_path, offset = chunk
-            segments = self.get_segments_for_chunk(chunk_path)
-            all_segments.extend(self.add_offset_to_segments(segments, offset))
+        async with self.make_client() as client:
+            tasks: List["asyncio.Task[List[TranscriptionSegment]]"] = []
+            # set once the producer's end marker has been taken off the queue
+            chunks_exhausted = False
+            try:
+                while True:
+                    # take a slot before pulling the next chunk so at most
+                    # max_concurrent chunks are held in memory beyond the queue
+                    await semaphore.acquire()
+                    # a failed chunk fails the whole transcription, so stop
+                    # uploading the rest as soon as one has failed for good
+                    if self.get_failed_task(tasks) is not None:
+                        semaphore.release()
+                        break
+                    item = await loop.run_in_executor(None, chunk_queue.get)
+                    if item is None:
+                        chunks_exhausted = True
+                        semaphore.release()
+                        break
+                    offset, chunk = item
+                    tasks.append(
+                        asyncio.create_task(transcribe_chunk(client, offset, chunk))
+                    )
+
+                failed_task = self.get_failed_task(tasks)
+                if failed_task is not None:
+                    # unblock the producer so its thread can exit, unless it
+                    # already has: there is no second end marker to wait for
+                    stop_producing.set()
+                    if not chunks_exhausted:
+                        await loop.run_in_executor(None, self.drain_chunks, chunk_queue)
+                    await producer
+                    error = failed_task.exception()
+                    assert error is not None
+                    raise error
+
+                # re-raises if extracting the chunks failed
+                await producer
+
+                # gather returns results in submission order, not completion order
+                results = await asyncio.gather(*tasks)
+            finally:
+                # do not leave uploads running once the transcription has failed
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        all_segments: List[TranscriptionSegment] = [
+            segment for segments in results for segment in segments
+        ]
 
-        shutil.rmtree(audio_chunk_path)
         return self.convert_segments(all_segments)
 
+    @staticmethod
+    def get_failed_task(
+        tasks: List["asyncio.Task[List[TranscriptionSegment]]"],
+    ) -> Optional["asyncio.Task[List[TranscriptionSegment]]"]:
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                return task
+        return None
+
+    def produce_chunks(
+        self,
+        audio_file_path: str,
+        chunk_queue: "queue.Queue[Optional[Tuple[int, BytesIO]]]",
+        stop_producing: threading.Event,
+    ) -> None:
+        try:
+            for chunk in self.iter_chunks(audio_file_path):
+                if stop_producing.is_set():
+                    break
+                chunk_queue.put(chunk)
+        finally:
+            # always signal the end, even on failure, so the consumer stops
+            chunk_queue.put(None)
+
+    @staticmethod
+    def drain_chunks(
+        chunk_queue: "queue.Queue[Optional[Tuple[int, BytesIO]]]",
+    ) -> None:
+        while chunk_queue.get() is not None:
+            pass
+
+    async def get_segments_for_chunk_with_retry(
+        self,
+        client: AsyncOpenAI,
+        offset_ms: int,
+        chunk: BytesIO,
+        rate_limiter: Optional[RateLimiter],
+    ) -> List[TranscriptionSegment]:
+        attempt = 0
+        while True:
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            try:
+                return await self.get_segments_for_chunk(client, chunk)
+            except (RateLimitError, InternalServerError, APIConnectionError) as e:
+                attempt += 1
+                if attempt > self.config.max_retries:
+                    self.logger.error(
+                        f"Failed to transcribe chunk at {offset_ms} ms "
+                        + f"after {attempt} attempts: {e}"
+                    )
+                    raise
+                wait_time = self.get_retry_wait_seconds(e, attempt)
+                self.logger.warning(
+                    f"Transcription of chunk at {offset_ms} ms failed "
+                    + f"(retry {attempt}/{self.config.max_retries}), "
+                    + f"retrying in {wait_time:.1f}s: {e}"
+                )
+                await asyncio.sleep(wait_time)
+
+    @staticmethod
+    def get_retry_wait_seconds(error: Exception, attempt: int) -> float:
+        # honor the server's Retry-After when it gives one
+        if isinstance(error, APIStatusError):
+            retry_after = error.response.headers.get("retry-after")
+            if retry_after is not None:
+                try:
+                    return max(0.0, float(retry_after))
+                except ValueError:
+                    pass
+
+        # exponential backoff with jitter: ~1, 2, 4, ... seconds, capped at 60
+        return float(min(60.0, 2 ** (attempt - 1) + random.uniform(0, 1)))
+
     @staticmethod
     def convert_segments(segments: List[TranscriptionSegment]) -> List[Segment]:
         return [
@@ -137,28 +402,55 @@ class RemoteWhisperTranscriber(Transcriber):
 
         return segments
 
-    def split_file(
+    def iter_chunks(
         self,
         audio_file_path: str,
-        audio_chunk_path: str,
         chunk_size_bytes: int = 24 * 1024 * 1024,
-    ) -> List[Tuple[str, int]]:
+    ) -> Iterator[Tuple[int, BytesIO]]:
+        """
+        Split the audio into in-memory mp3 chunks small enough for the
+        transcription api. Yields each chunk with its start offset in ms.
+        """
 
         self.logger.info(f"Splitting file {audio_file_path} into chunks")
 
-        if not os.path.exists(audio_chunk_path):
-            os.makedirs(audio_chunk_path)
-        self.logger.info(f"Chunk path: {audio_chunk_path}")
-
-        audio = AudioSegment.from_mp3(audio_file_path)
-        duration_ms = len(audio)
-
-        self.logger.info(f"Audio duration: {duration_ms} ms")
+        # the mp3 headers only describe the start of the file: without a
+        # xing/vbri header, or with ads stitched in, their length is too short,
+        # so take the length from the frames themselves
+        duration_ms = self.get_duration_ms(audio_file_path)
+        if duration_ms <= 0:
+            raise ValueError(f"No audio found in {audio_file_path}")
+
+        average_bitrate = os.path.getsize(audio_file_path) * 8000 / duration_ms
+        bitrate = average_bitrate
+
+        # the headers are only advisory, so a file ffmpeg reads fine is still
+        # transcribed when mutagen cannot parse them
+        try:
+            info: Any = MP3(audio_file_path).info  # type: ignore[no-untyped-call]
+        except MutagenError as e:
+            self.logger.warning(
+                f"Could not read mp3 headers of {audio_file_path}, "
+                + f"using the average bitrate: {e}"
+            )
+        else:
+            header_duration_ms = int(float(info.length) * 1000)
+            header_bitrate = int(info.bitrate)  # pylint: disable=no-member
+            if header_duration_ms < duration_ms:
+                self.logger.warning(
+                    f"mp3 headers of {audio_file_path} give a duration of "
+                    + f"{header_duration_ms} ms, shorter than the {duration_ms} ms "
+                    + "of audio in the file"
+                )
+            # a VBR file without an accurate header can report a low bitrate,
+            # so never assume fewer bits per second than the file's average
+            bitrate = max(header_bitrate, average_bitrate)
+
+        self.logger.info(
+            f"Audio duration: {duration_ms} ms, bitrate: {bitrate:.0f} bps"
+        )
 
-        chunk_duration_ms = (
-            chunk_size_bytes / os.path.getsize(audio_file_path)
-        ) * duration_ms
-        chunk_duration_ms = int(chunk_duration_ms)
+        chunk_duration_ms = int(chunk_size_bytes * 8 / bitrate * 1000)
 
         self.logger.info(f"Chunk duration: {chunk_duration_ms} ms")
 
@@ -166,38 +458,94 @@ class RemoteWhisperTranscriber(Transcriber):
 
         self.logger.info(f"Number of chunks: {num_chunks}")
 
-        chunks: List[Tuple[str, int]] = []
-
         for i in range(num_chunks):
             start_offset_ms = i * chunk_duration_ms
-            end_offset_ms = (i + 1) * chunk_duration_ms
-            chunk = audio[start_offset_ms:end_offset_ms]
-            export_path = f"{audio_chunk_path}/{i}.mp3"
-            chunk.export(export_path, format="mp3")
-            chunks.append((export_path, start_offset_ms))
+            yield start_offset_ms, self.extract_chunk(
+                audio_file_path, start_offset_ms, chunk_duration_ms
+            )
 
-        self.logger.info(f"Split into {len(chunks)} chunks")
+    @staticmethod
+    def get_duration_ms(audio_file_path: str) -> int:
+        # stream copy every frame to nowhere: exact, but with no decoding it
+        # takes about a second per hour of audio
+        result = subprocess.run(
+            [
+                "ffmpeg",
+                "-v",
+                "quiet",
+                "-i",
+                audio_file_path,
+                "-map",
+                "0:a:0",
+                "-c",
+                "copy",
+                "-f",
+                "null",
+                "-progress",
+                "pipe:1",
+                "-",
+            ],
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+        duration_us = 0
+        for line in result.stdout.splitlines():
+            key, _, value = line.partition("=")
+            if key == "out_time_us" and value.isdigit():
+                duration_us = int(value)
+        return duration_us // 1000
 
-        return chunks
+    @staticmethod
+    def extract_chunk(
+        audio_file_path: str, start_offset_ms: int, duration_ms: int
+    ) -> BytesIO:
+        # stream copy the mp3 frames rather than decoding and re-encoding
+        result = subprocess.run(
+            [
+                "ffmpeg",
+                "-v",
+                "quiet",
+                "-ss",
+                f"{start_offset_ms / 1000:.3f}",
+                "-t",
+                f"{duration_ms / 1000:.3f}",
+                "-i",
+                audio_file_path,
+                "-map",
+                "0:a:0",
+                "-c",
+                "copy",
+                "-f",
+                "mp3",
+                "pipe:1",
+            ],
+            capture_output=True,
+            check=True,
+        )
+        return BytesIO(result.stdout)
 
-    def get_segments_for_chunk(self, chunk_path: str) -> List[TranscriptionSegment]:
-        with open(chunk_path, "rb") as f:
+    async def get_segments_for_chunk(
+        self, client: AsyncOpenAI, chunk: BytesIO
+    ) -> List[TranscriptionSegment]:
+        # rewind in case a previous attempt already consumed the buffer
+        chunk.seek(0)
 
-            self.logger.info(f"Transcribing chunk {chunk_path}")
+        self.logger.info(f"Transcribing chunk of {chunk.getbuffer().nbytes} bytes")
 
-            transcription = self.openai_client.audio.transcriptions.create(
-                model=self.config.model,
-                file=f,
-                timestamp_granularities=["segment"],
-                language=self.config.language,
-                response_format="verbose_json",
-            )
+        transcription = await client.audio.transcriptions.create(
+            model=self.config.model,
+            file=("chunk.mp3", chunk, "audio/mpeg"),
+            timestamp_granularities=["segment"],
+            language=self.config.language,
+            response_format="verbose_json",
+        )
 
-            self.logger.debug("Got transcription")
+        self.logger.debug("Got transcription")
 
-            segments = transcription.segments
-            assert segments is not None
+        segments = transcription.segments
+        assert segments is not None
 
-            self.logger.debug(f"Got {len(segments)} segments")
+        self.logger.debug(f"Got {len(segments)} segments")
 
-            return segments
+        return segments
@@ -33,6 +33,9 @@ class RemoteWhisperConfig(BaseModel):
     api_key: str
     language: str = "en"
     model: str = "whisper-1"  # openai model, use your own maybe
+    max_concurrent_requests: int = 5
+    max_requests_per_minute: Optional[int] = None
+    max_retries: int = 5
 
 
 class LocalWhisperConfig(BaseModel):
@@ -57,6 +60,8 @@ class Config(BaseModel):
     server_port: int = 5001
     background_update_interval_minute: Optional[int] = None
     threads: int = 1
+    feed_fetch_workers: int = 4
+    feed_item_limit: Optional[int] = 100
     whisper: Optional[LocalWhisperConfig | RemoteWhisperConfig | TestWhisperConfig] = (
         Field(
             default=None,
@@ -1,6 +1,5 @@
 import logging
 import os
-import re
 from pathlib import Path
 from typing import Any, Optional
 
@@ -9,6 +8,7 @@ import validators
 from flask import abort
 
 from app.models import Post
+from shared.processing_paths import TITLE_SANITIZE_PATTERN
 
 logger = logging.getLogger(__name__)
 
@@ -43,7 +43,7 @@ def download_episode(post: Post) -> Optional[str]:
 
 
 def get_and_make_download_path(post_title: str) -> Path:
-    sanitized_title = re.sub(r"[^a-zA-Z0-9\s]", "", post_title)
+    sanitized_title = TITLE_SANITIZE_PATTERN.sub("", post_title)
 
     post_directory = sanitized_title
     post_filename = sanitized_title + ".mp3"
@@ -3,6 +3,9 @@ from dataclasses import dataclass
 from pathlib import Path
 
 PROCESSING_DIR: str = "processing"
+# characters stripped from titles before they are used as file names
+TITLE_SANITIZE_PATTERN = re.compile(r"[^a-zA-Z0-9\s]")
+TRANSCRIPTION_CACHE_DIR: Path = Path(PROCESSING_DIR) / "transcription_cache"
 
 
 @dataclass
@@ -16,7 +19,7 @@ def paths_from_unprocessed_path(
     unprocessed_path: str, feed_title: str
 ) -> ProcessingPaths:
     unprocessed_filename = Path(unprocessed_path).name
-    sanitized_feed_title = re.sub(r"[^a-zA-Z0-9\s]", "", feed_title)
+    sanitized_feed_title = TITLE_SANITIZE_PATTERN.sub("", feed_title)
 
     audio_processing_dir = (
         Path(PROCESSING_DIR) / sanitized_feed_title / unprocessed_filename
@@ -0,0 +1,25 @@
+import logging
+from pathlib import Path
+from types import ModuleType
+from unittest.mock import MagicMock
+
+import pytest
+from flask_sqlalchemy import SQLAlchemy
+from pytest_mock import MockerFixture
+
+from shared.config import get_config
+
+
+@pytest.fixture(name="app_package")
+def app_package_fixture(mocker: MockerFixture) -> ModuleType:
+    # importing the real app package reads config/config.yml and sets up the
+    # server, so stand in a package with just what its modules import from it
+    app_module = ModuleType("app")
+    app_module.__path__ = [str(Path(__file__).parents[1] / "app")]
+    app_module.config = get_config("config/config.yml.example")  # type: ignore[attr-defined]
+    app_module.db = SQLAlchemy()  # type: ignore[attr-defined]
+    app_module.logger = logging.getLogger("global_logger")  # type: ignore[attr-defined]
+    app_module.scheduler = MagicMock()  # type: ignore[attr-defined]
+    # whisper is not installed properly in CI
+    mocker.patch.dict("sys.modules", {"app": app_module, "whisper": MagicMock()})
+    return app_module
@@ -0,0 +1,74 @@
+from types import ModuleType
+from typing import Any
+from unittest.mock import MagicMock
+
+import feedparser  # type: ignore[import-untyped]
+import pytest
+from pytest_mock import MockerFixture
+
+FEED_URL = "http://localhost/feed.xml"
+
+
+@pytest.fixture(name="feeds")
+def feeds_fixture(
+    app_package: ModuleType,  # pylint: disable=unused-argument
+) -> Any:
+    # pylint: disable=import-outside-toplevel
+    import app.feeds
+
+    return app.feeds
+
+
+def make_feed_data(status: int, entries: int = 0) -> feedparser.FeedParserDict:
+    return feedparser.FeedParserDict(
+        status=status,
+        bozo=False,
+        entries=[MagicMock(id=f"entry-{i}") for i in range(entries)],
+        feed=feedparser.FeedParserDict(title="a feed"),
+        href=FEED_URL,
+    )
+
+
+def test_fetch_feed_sends_conditional_get(feeds: Any, mocker: MockerFixture) -> None:
+    parse = mocker.patch.object(
+        feeds.feedparser, "parse", return_value=make_feed_data(304)
+    )
+
+    assert feeds.fetch_feed(FEED_URL, etag='"abc"', modified="yesterday") is None
+    parse.assert_called_once_with(FEED_URL, etag='"abc"', modified="yesterday")
+    assert FEED_URL not in feeds.failed_fetches
+
+
+def test_fetch_feed_skips_recently_failed(feeds: Any, mocker: MockerFixture) -> None:
+    parse = mocker.patch.object(
+        feeds.feedparser, "parse", return_value=make_feed_data(500)
+    )
+
+    assert feeds.fetch_feed(FEED_URL) is None
+    assert FEED_URL in feeds.failed_fetches
+    assert feeds.fetch_feed(FEED_URL) is None
+    assert parse.call_count == 1
+
+    # the failure expires after FAILED_FETCH_RETRY_SECONDS
+    feeds.failed_fetches[FEED_URL] -= feeds.FAILED_FETCH_RETRY_SECONDS
+    parse.return_value = make_feed_data(200, entries=1)
+    mocker.patch.object(feeds, "get_guid", return_value="guid")
+    feed_data = feeds.fetch_feed(FEED_URL)
+    assert feed_data is not None
+    assert feed_data.entries[0].id == "guid"
+    assert parse.call_count == 2
+    assert FEED_URL not in feeds.failed_fetches
+
+
+def test_add_or_refresh_feed_ignores_recent_failure(
+    feeds: Any, mocker: MockerFixture
+) -> None:
+    parse = mocker.patch.object(
+        feeds.feedparser, "parse", return_value=make_feed_data(500)
+    )
+
+    with pytest.raises(ValueError):
+        feeds.add_or_refresh_feed(FEED_URL)
+    with pytest.raises(ValueError):
+        feeds.add_or_refresh_feed(FEED_URL)
+    assert parse.call_count == 2
@@ -0,0 +1,138 @@
+import threading
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Iterator, Tuple
+
+import pytest
+from flask import Flask
+from flask.testing import FlaskClient
+from pytest_mock import MockerFixture
+
+GUID = "11111111-1111-1111-1111-111111111111"
+
+
+@pytest.fixture(name="app_and_client")
+def app_and_client_fixture(
+    app_package: ModuleType, tmp_path: Path
+) -> Iterator[Tuple[Flask, FlaskClient]]:
+    # pylint: disable=import-outside-toplevel
+    from app.models import Feed, Post
+    from app.routes import main_bp
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'test.db'}"
+    db = app_package.db
+    db.init_app(app)
+    app.register_blueprint(main_bp)
+
+    with app.app_context():
+        db.create_all()
+        feed = Feed(title="a feed", rss_url="http://localhost/feed.xml")
+        db.session.add(feed)
+        db.session.commit()
+        db.session.add(
+            Post(
+                feed_id=feed.id,
+                guid=GUID,
+                download_url="http://localhost/episode.mp3",
+                title="an episode",
+                whitelisted=True,
+            )
+        )
+        db.session.commit()
+
+    yield app, app.test_client()
+
+
+@pytest.fixture(name="jobs")
+def jobs_fixture(app_package: ModuleType) -> Any:  # pylint: disable=unused-argument
+    # pylint: disable=import-outside-toplevel
+    import app.jobs
+
+    return app.jobs
+
+
+def test_download_unprocessed_post_queues_once(
+    app_and_client: Tuple[Flask, FlaskClient], jobs: Any, mocker: MockerFixture
+) -> None:
+    _, client = app_and_client
+    release = threading.Event()
+    process = mocker.patch.object(
+        jobs, "download_and_process_post", side_effect=lambda _: release.wait(10)
+    )
+
+    # podcast clients must not mistake the status for the audio
+    response = client.get(f"/post/{GUID}.mp3", headers={"Accept": "*/*"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "60"
+    assert response.headers["Location"] == f"/post/{GUID}/status"
+
+    # a browser gets the json status instead
+    response = client.get(
+        f"/post/{GUID}.mp3", headers={"Accept": "text/html,*/*;q=0.8"}
+    )
+    assert response.status_code == 202
+    assert response.get_json() == {
+        "status": "processing",
+        "status_url": f"/post/{GUID}/status",
+    }
+
+    assert client.get(f"/post/{GUID}/status").get_json() == {"status": "processing"}
+
+    release.set()
+    jobs.post_processing_executor.shutdown(wait=True)
+    assert process.call_count == 1
+
+
+def test_finished_jobs_move_to_finished_post_processing(
+    app_and_client: Tuple[Flask, FlaskClient], jobs: Any, mocker: MockerFixture
+) -> None:
+    app, client = app_and_client
+    mocker.patch.object(
+        jobs, "download_and_process_post", side_effect=RuntimeError("boom")
+    )
+
+    jobs.enqueue_post_processing(app, GUID)
+    jobs.post_processing_executor.shutdown(wait=True)
+
+    assert GUID not in jobs.post_processing_jobs
+    assert jobs.finished_post_processing[GUID] == {"status": "failed", "error": "boom"}
+    assert client.get(f"/post/{GUID}/status").get_json() == {
+        "status": "failed",
+        "error": "boom",
+    }
+
+
+def test_finished_job_status_done(
+    app_and_client: Tuple[Flask, FlaskClient], jobs: Any, mocker: MockerFixture
+) -> None:
+    app, client = app_and_client
+    mocker.patch.object(jobs, "download_and_process_post", return_value="out.mp3")
+
+    jobs.enqueue_post_processing(app, GUID)
+    jobs.post_processing_executor.shutdown(wait=True)
+
+    assert GUID not in jobs.post_processing_jobs
+    assert client.get(f"/post/{GUID}/status").get_json() == {"status": "done"}
+
+
+def test_status_redirects_once_processed(
+    app_and_client: Tuple[Flask, FlaskClient], app_package: ModuleType, tmp_path: Path
+) -> None:
+    # pylint: disable=import-outside-toplevel
+    from app.models import Post
+
+    app, client = app_and_client
+    processed_path = tmp_path / "processed.mp3"
+    processed_path.write_bytes(b"audio")
+    with app.app_context():
+        Post.query.filter_by(guid=GUID).one().processed_audio_path = str(processed_path)
+        app_package.db.session.commit()
+
+    response = client.get(f"/post/{GUID}/status")
+    assert response.status_code == 302
+    assert response.headers["Location"] == f"/post/{GUID}.mp3"
+
+    response = client.get(f"/post/{GUID}.mp3")
+    assert response.status_code == 200
+    assert response.data == b"audio"
@@ -1,8 +1,15 @@
+import asyncio
 import logging
+import threading
+from io import BytesIO
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
 from unittest.mock import MagicMock
 
 import pytest
 import yaml
+from mutagen.mp3 import HeaderNotFoundError
+from openai import AsyncOpenAI, RateLimitError
 from openai.types.audio.transcription_segment import TranscriptionSegment
 from pytest_mock import MockerFixture
 
@@ -78,3 +85,433 @@ def test_offset() -> None:
             end=45.800999999999995,
         )
     ]
+
+
+def test_remote_transcribe_preserves_chunk_order(
+    mocker: MockerFixture, tmp_path: Path
+) -> None:
+    # import here instead of the toplevel because torch is not installed properly in CI.
+    from podcast_processor.transcribe import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperTranscriber,
+        Segment,
+    )
+    from shared.config import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperConfig,
+    )
+
+    transcriber = RemoteWhisperTranscriber(
+        logging.getLogger("global_logger"),
+        RemoteWhisperConfig(api_key="this_is_fake"),
+        max_concurrent=2,
+        cache_dir=tmp_path,
+    )
+    mocker.patch.object(transcriber, "hash_file", return_value="abc")
+
+    mocker.patch.object(
+        transcriber,
+        "iter_chunks",
+        return_value=iter(
+            [(0, BytesIO(b"0")), (10_000, BytesIO(b"1")), (20_000, BytesIO(b"2"))]
+        ),
+    )
+
+    def fake_segments(_: AsyncOpenAI, chunk: BytesIO) -> List[TranscriptionSegment]:
+        return [
+            TranscriptionSegment(
+                id=0,
+                avg_logprob=0,
+                seek=0,
+                temperature=0,
+                text=chunk.getvalue().decode(),
+                tokens=[],
+                compression_ratio=0,
+                no_speech_prob=0,
+                start=1,
+                end=2,
+            )
+        ]
+
+    mocker.patch.object(
+        transcriber, "get_segments_for_chunk", side_effect=fake_segments
+    )
+
+    assert transcriber.transcribe("file.mp3") == [
+        Segment(start=1, end=2, text="0"),
+        Segment(start=11, end=12, text="1"),
+        Segment(start=21, end=22, text="2"),
+    ]
+
+
+def test_retry_wait_backs_off_exponentially() -> None:
+    # import here instead of the toplevel because torch is not installed properly in CI.
+    from podcast_processor.transcribe import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperTranscriber,
+    )
+
+    error = Exception("boom")
+    assert 1 <= RemoteWhisperTranscriber.get_retry_wait_seconds(error, 1) <= 2
+    assert 4 <= RemoteWhisperTranscriber.get_retry_wait_seconds(error, 3) <= 5
+    assert RemoteWhisperTranscriber.get_retry_wait_seconds(error, 10) == 60
+
+
+def test_iter_chunks_yields_every_chunk(mocker: MockerFixture) -> None:
+    # import here instead of the toplevel because torch is not installed properly in CI.
+    from podcast_processor.transcribe import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperTranscriber,
+    )
+    from shared.config import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperConfig,
+    )
+
+    transcriber = RemoteWhisperTranscriber(
+        logging.getLogger("global_logger"), RemoteWhisperConfig(api_key="this_is_fake")
+    )
+
+    # 100 s of audio at 80 bits per second, so 250 byte chunks are 25 s long
+    mocker.patch.object(transcriber, "get_duration_ms", return_value=100_000)
+    mp3 = mocker.patch("podcast_processor.transcribe.MP3")
+    mp3.return_value.info.length = 100.0
+    mp3.return_value.info.bitrate = 80
+    mocker.patch("podcast_processor.transcribe.os.path.getsize", return_value=1000)
+    extract_chunk = mocker.patch.object(
+        transcriber, "extract_chunk", return_value=BytesIO(b"")
+    )
+
+    chunks = list(transcriber.iter_chunks("file.mp3", chunk_size_bytes=250))
+
+    assert [offset for offset, _ in chunks] == [0, 25_000, 50_000, 75_000]
+    assert extract_chunk.call_count == 4
+
+
+def test_iter_chunks_reads_past_short_header(mocker: MockerFixture) -> None:
+    # import here instead of the toplevel because torch is not installed properly in CI.
+    from podcast_processor.transcribe import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperTranscriber,
+    )
+    from shared.config import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperConfig,
+    )
+
+    transcriber = RemoteWhisperTranscriber(
+        logging.getLogger("global_logger"), RemoteWhisperConfig(api_key="this_is_fake")
+    )
+
+    # the headers only describe the first 50 s of 100 s of audio, as when ads
+    # are stitched into an episode
+    mocker.patch.object(transcriber, "get_duration_ms", return_value=100_000)
+    mp3 = mocker.patch("podcast_processor.transcribe.MP3")
+    mp3.return_value.info.length = 50.0
+    mp3.return_value.info.bitrate = 80
+    mocker.patch("podcast_processor.transcribe.os.path.getsize", return_value=1000)
+    mocker.patch.object(transcriber, "extract_chunk", return_value=BytesIO(b""))
+
+    chunks = list(transcriber.iter_chunks("file.mp3", chunk_size_bytes=250))
+
+    assert [offset for offset, _ in chunks] == [0, 25_000, 50_000, 75_000]
+
+
+def test_iter_chunks_without_readable_header(mocker: MockerFixture) -> None:
+    # import here instead of the toplevel because torch is not installed properly in CI.
+    from podcast_processor.transcribe import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperTranscriber,
+    )
+    from shared.config import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperConfig,
+    )
+
+    transcriber = RemoteWhisperTranscriber(
+        logging.getLogger("global_logger"), RemoteWhisperConfig(api_key="this_is_fake")
+    )
+
+    # 100 s of audio averaging 80 bits per second, so 250 byte chunks are 25 s
+    mocker.patch.object(transcriber, "get_duration_ms", return_value=100_000)
+    mocker.patch(
+        "podcast_processor.transcribe.MP3",
+        side_effect=HeaderNotFoundError("can't sync to MPEG frame"),
+    )
+    mocker.patch("podcast_processor.transcribe.os.path.getsize", return_value=1000)
+    mocker.patch.object(transcriber, "extract_chunk", return_value=BytesIO(b""))
+
+    chunks = list(transcriber.iter_chunks("file.mp3", chunk_size_bytes=250))
+
+    assert [offset for offset, _ in chunks] == [0, 25_000, 50_000, 75_000]
+
+
+def test_iter_chunks_rejects_file_without_audio(mocker: MockerFixture) -> None:
+    # import here instead of the toplevel because torch is not installed properly in CI.
+    from podcast_processor.transcribe import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperTranscriber,
+    )
+    from shared.config import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperConfig,
+    )
+
+    transcriber = RemoteWhisperTranscriber(
+        logging.getLogger("global_logger"), RemoteWhisperConfig(api_key="this_is_fake")
+    )
+    mocker.patch.object(transcriber, "get_duration_ms", return_value=0)
+
+    with pytest.raises(ValueError, match="No audio found"):
+        list(transcriber.iter_chunks("file.mp3"))
+
+
+def test_remote_transcribe_uses_cache(mocker: MockerFixture, tmp_path: Path) -> None:
+    # import here instead of the toplevel because torch is not installed properly in CI.
+    from podcast_processor.transcribe import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperTranscriber,
+        Segment,
+    )
+    from shared.config import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperConfig,
+    )
+
+    audio_path = tmp_path / "file.mp3"
+    audio_path.write_bytes(b"not really an mp3")
+
+    transcriber = RemoteWhisperTranscriber(
+        logging.getLogger("global_logger"),
+        RemoteWhisperConfig(api_key="this_is_fake"),
+        cache_dir=tmp_path / "cache",
+    )
+    segments = [Segment(start=0, end=1, text="hi")]
+    atranscribe = mocker.patch.object(
+        transcriber, "_atranscribe", side_effect=[segments]
+    )
+
+    assert transcriber.transcribe(str(audio_path)) == segments
+    assert transcriber.transcribe(str(audio_path)) == segments
+    assert atranscribe.call_count == 1
+
+
+def make_rate_limit_error(retry_after: Optional[str] = None) -> RateLimitError:
+    response = MagicMock(status_code=429)
+    response.headers = {"retry-after": retry_after} if retry_after is not None else {}
+    return RateLimitError("rate limited", response=response, body=None)
+
+
+def test_retry_wait_honors_retry_after() -> None:
+    # import here instead of the toplevel because torch is not installed properly in CI.
+    from podcast_processor.transcribe import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperTranscriber,
+    )
+
+    error = make_rate_limit_error(retry_after="7")
+    assert RemoteWhisperTranscriber.get_retry_wait_seconds(error, 1) == 7
+    # an unparseable header falls back to backoff
+    error = make_rate_limit_error(retry_after="soon")
+    assert 1 <= RemoteWhisperTranscriber.get_retry_wait_seconds(error, 1) <= 2
+
+
+def test_chunk_retried_until_success(mocker: MockerFixture) -> None:
+    # import here instead of the toplevel because torch is not installed properly in CI.
+    from podcast_processor.transcribe import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperTranscriber,
+    )
+    from shared.config import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperConfig,
+    )
+
+    transcriber = RemoteWhisperTranscriber(
+        logging.getLogger("global_logger"),
+        RemoteWhisperConfig(api_key="this_is_fake", max_retries=2),
+    )
+    get_segments = mocker.patch.object(
+        transcriber,
+        "get_segments_for_chunk",
+        side_effect=[make_rate_limit_error("0"), make_rate_limit_error("0"), []],
+    )
+
+    assert not asyncio.run(
+        transcriber.get_segments_for_chunk_with_retry(
+            transcriber.make_client(), 0, BytesIO(b""), None
+        )
+    )
+    assert get_segments.call_count == 3
+
+
+def test_chunk_retries_give_up_after_max_retries(mocker: MockerFixture) -> None:
+    # import here instead of the toplevel because torch is not installed properly in CI.
+    from podcast_processor.transcribe import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperTranscriber,
+    )
+    from shared.config import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperConfig,
+    )
+
+    transcriber = RemoteWhisperTranscriber(
+        logging.getLogger("global_logger"),
+        RemoteWhisperConfig(api_key="this_is_fake", max_retries=2),
+    )
+    get_segments = mocker.patch.object(
+        transcriber,
+        "get_segments_for_chunk",
+        side_effect=[make_rate_limit_error("0") for _ in range(3)],
+    )
+
+    with pytest.raises(RateLimitError):
+        asyncio.run(
+            transcriber.get_segments_for_chunk_with_retry(
+                transcriber.make_client(), 0, BytesIO(b""), None
+            )
+        )
+    # the first attempt plus max_retries retries
+    assert get_segments.call_count == 3
+
+
+def test_rate_limiter_shared_across_event_loops(mocker: MockerFixture) -> None:
+    # import here instead of the toplevel because torch is not installed properly in CI.
+    from podcast_processor.transcribe import (  # pylint: disable=import-outside-toplevel
+        RateLimiter,
+    )
+
+    now = [0.0]
+    mocker.patch(
+        "podcast_processor.transcribe.time.monotonic", side_effect=lambda: now[0]
+    )
+    rate_limiter = RateLimiter(2)
+
+    # both tokens are spent, even from separate asyncio.run loops
+    asyncio.run(rate_limiter.acquire())
+    asyncio.run(rate_limiter.acquire())
+    assert rate_limiter.try_acquire() == pytest.approx(30)
+
+    # refills at 2 per minute
+    now[0] = 30.0
+    assert rate_limiter.try_acquire() == 0
+    assert rate_limiter.try_acquire() == pytest.approx(30)
+
+
+def test_remote_transcribe_cache_keyed_by_model_and_language(
+    mocker: MockerFixture, tmp_path: Path
+) -> None:
+    # import here instead of the toplevel because torch is not installed properly in CI.
+    from podcast_processor.transcribe import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperTranscriber,
+        Segment,
+    )
+    from shared.config import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperConfig,
+    )
+
+    audio_path = tmp_path / "file.mp3"
+    audio_path.write_bytes(b"not really an mp3")
+    segments = [Segment(start=0, end=1, text="hi")]
+
+    atranscribe_calls = 0
+    for config in [
+        RemoteWhisperConfig(api_key="this_is_fake"),
+        RemoteWhisperConfig(api_key="this_is_fake", model="openai/whisper-large"),
+        RemoteWhisperConfig(api_key="this_is_fake", language="de"),
+    ]:
+        transcriber = RemoteWhisperTranscriber(
+            logging.getLogger("global_logger"), config, cache_dir=tmp_path / "cache"
+        )
+        atranscribe = mocker.patch.object(
+            transcriber, "_atranscribe", side_effect=[segments]
+        )
+        assert transcriber.transcribe(str(audio_path)) == segments
+        atranscribe_calls += atranscribe.call_count
+
+    assert atranscribe_calls == 3
+    assert len(list((tmp_path / "cache").iterdir())) == 3
+
+
+def test_remote_transcribe_stops_after_failed_chunk(
+    mocker: MockerFixture, tmp_path: Path
+) -> None:
+    # import here instead of the toplevel because torch is not installed properly in CI.
+    from podcast_processor.transcribe import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperTranscriber,
+    )
+    from shared.config import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperConfig,
+    )
+
+    transcriber = RemoteWhisperTranscriber(
+        logging.getLogger("global_logger"),
+        RemoteWhisperConfig(api_key="this_is_fake"),
+        max_concurrent=2,
+        cache_dir=tmp_path,
+    )
+    mocker.patch.object(transcriber, "hash_file", return_value="abc")
+
+    extracted = []
+
+    def fake_chunks(_: str) -> Iterator[Tuple[int, BytesIO]]:
+        for i in range(20):
+            extracted.append(i)
+            yield i * 10_000, BytesIO(str(i).encode())
+
+    mocker.patch.object(transcriber, "iter_chunks", side_effect=fake_chunks)
+
+    async def fake_segments(
+        _: AsyncOpenAI, chunk: BytesIO
+    ) -> List[TranscriptionSegment]:
+        if chunk.getvalue() == b"1":
+            raise ValueError("chunk 1 is broken")
+        await asyncio.sleep(0.01)
+        return []
+
+    get_segments = mocker.patch.object(
+        transcriber, "get_segments_for_chunk", side_effect=fake_segments
+    )
+
+    with pytest.raises(ValueError, match="chunk 1 is broken"):
+        transcriber.transcribe("file.mp3")
+
+    assert get_segments.call_count < 5
+    assert len(extracted) < 20
+    assert not list(tmp_path.iterdir())
+
+
+def test_remote_transcribe_fails_when_last_chunk_fails(
+    mocker: MockerFixture, tmp_path: Path
+) -> None:
+    # import here instead of the toplevel because torch is not installed properly in CI.
+    from podcast_processor.transcribe import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperTranscriber,
+    )
+    from shared.config import (  # pylint: disable=import-outside-toplevel
+        RemoteWhisperConfig,
+    )
+
+    transcriber = RemoteWhisperTranscriber(
+        logging.getLogger("global_logger"),
+        RemoteWhisperConfig(api_key="this_is_fake"),
+        cache_dir=tmp_path,
+    )
+    mocker.patch.object(transcriber, "hash_file", return_value="abc")
+    mocker.patch.object(
+        transcriber,
+        "iter_chunks",
+        return_value=iter([(0, BytesIO(b"0")), (10_000, BytesIO(b"1"))]),
+    )
+
+    async def fake_segments(
+        _: AsyncOpenAI, chunk: BytesIO
+    ) -> List[TranscriptionSegment]:
+        # the last chunk fails before the end of the chunks is read
+        if chunk.getvalue() == b"1":
+            raise ValueError("chunk 1 is broken")
+        await asyncio.sleep(0.1)
+        return []
+
+    mocker.patch.object(
+        transcriber, "get_segments_for_chunk", side_effect=fake_segments
+    )
+
+    errors: List[Exception] = []
+
+    def transcribe() -> None:
+        try:
+            transcriber.transcribe("file.mp3")
+        except ValueError as e:
+            errors.append(e)
+
+    # run on a daemon thread so a hang fails the test instead of the suite
+    thread = threading.Thread(target=transcribe, daemon=True)
+    thread.start()
+    thread.join(timeout=10)
+
+    assert not thread.is_alive()
+    assert [str(e) for e in errors] == ["chunk 1 is broken"]